@@ -37,7 +37,54 @@ class DB:
         return cls.conn
 
 
-def upload(name, asm, compilers, compiler_args, strip):
+def has(name, compilers, compiler_args, strip):
+    """
+    Check whether a fully passing disassembled entry keyed like
+    upload()'s was already recorded for this platform, distro, CI image
+    and CI commit. Rows uploaded with success=False do not count, so
+    failing cells are retried on reruns.
+    """
+    conn = DB()
+    if not conn:
+        return False
+
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        SELECT 1
+        FROM disassembled
+        WHERE name = %s
+          AND compiler = %s
+          AND compiler_args = %s
+          AND platform = %s
+          AND distro = %s
+          AND strip = %s
+          AND success
+          AND ci_job_image IS NOT DISTINCT FROM %s
+          AND ci_commit_sha IS NOT DISTINCT FROM %s
+        LIMIT 1
+    """,
+        (
+            name,
+            " ".join(compilers),
+            " ".join(compiler_args),
+            platform.system(),
+            platform.platform(),
+            strip,
+            os.environ.get("CI_JOB_IMAGE"),
+            os.environ.get("CI_COMMIT_SHA"),
+        ),
+    )
+    return cursor.fetchone() is not None
+
+
+def upload(name, asm, compilers, compiler_args, strip, success=False):
+    """
+    'success' records whether the cell's whole
+    disassemble-reassemble-test pipeline passed, not just the
+    disassembly that produced 'asm'; has() only skips cells uploaded
+    with success=True.
+    """
     conn = DB()
     if conn:
         cursor = conn.cursor()
@@ -74,9 +121,10 @@ def upload(name, asm, compilers, compiler_args, strip):
                 ci_commit_before_sha,
                 ci_commit_branch,
                 ci_commit_ref_slug,
-                strip
+                strip,
+                success
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """,
             (
                 name,
@@ -92,6 +140,7 @@ def upload(name, asm, compilers, compiler_args, strip):
                 os.environ.get("CI_COMMIT_BRANCH"),
                 os.environ.get("CI_COMMIT_REF_SLUG"),
                 strip,
+                success,
             ),
         )
 
@@ -0,0 +1,100 @@
+import os
+import platform
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import disassemble_reassemble_check as drc
+
+ex_dir = Path("./examples/")
+
+
+class CompileCacheTests(unittest.TestCase):
+    """
+    Test that the compile cache keyed on the source tree and compiler
+    settings is hit on unchanged sources and invalidated on edits.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.project = os.path.join(self.tmp_dir, "ex1")
+        shutil.copytree(ex_dir / "ex1", self.project)
+        self.cache = os.path.join(self.tmp_dir, "cache")
+
+    def compile_counting_builds(self):
+        """
+        Run compile() against the project with the cache enabled and
+        return (success, number of build 'make' invocations). The clean
+        invocation always runs and is not counted.
+        """
+        builds = []
+        real_run = drc.subprocess.run
+
+        def spying_run(cmd, *args, **kwargs):
+            if "make" in cmd and "clean" not in cmd:
+                builds.append(cmd)
+            return real_run(cmd, *args, **kwargs)
+
+        with mock.patch.object(
+            drc, "COMPILE_CACHE", self.cache
+        ), mock.patch.object(drc.subprocess, "run", spying_run):
+            success = drc.compile(
+                "gcc", "g++", "-O0", [], binary="ex", cwd=self.project
+            )
+        return success, len(builds)
+
+    @unittest.skipUnless(
+        platform.system() == "Linux", "This test is linux only."
+    )
+    def test_cache_hit_and_invalidation(self):
+        binary = os.path.join(self.project, "ex")
+
+        success, builds = self.compile_counting_builds()
+        self.assertTrue(success)
+        self.assertEqual(builds, 1)
+        self.assertTrue(os.path.isfile(binary))
+
+        # Unchanged sources: the binary is restored from the cache
+        # without running the build, along with the build's by-products
+        # ('make clean' deleted out.txt, which 'make check' diffs
+        # against), so the testing step still passes.
+        success, builds = self.compile_counting_builds()
+        self.assertTrue(success)
+        self.assertEqual(builds, 0)
+        self.assertTrue(os.path.isfile(binary))
+        self.assertTrue(
+            os.path.isfile(os.path.join(self.project, "out.txt"))
+        )
+        self.assertTrue(drc.test(cwd=self.project))
+
+        # Touching a source invalidates the key and rebuilds.
+        source = os.path.join(self.project, "ex.c")
+        stat = os.stat(source)
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        success, builds = self.compile_counting_builds()
+        self.assertTrue(success)
+        self.assertEqual(builds, 1)
+
+    @unittest.skipUnless(
+        platform.system() == "Linux", "This test is linux only."
+    )
+    def test_different_flags_miss(self):
+        success, builds = self.compile_counting_builds()
+        self.assertTrue(success)
+        self.assertEqual(builds, 1)
+
+        # A different optimization level maps to a different cache key.
+        with mock.patch.object(drc, "COMPILE_CACHE", self.cache):
+            self.assertTrue(
+                drc.compile(
+                    "gcc", "g++", "-O2", [], binary="ex", cwd=self.project
+                )
+            )
+        self.assertEqual(len(os.listdir(self.cache)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,17 +1,54 @@
 import argparse
 import contextlib
-import gtirb
+import functools
+import hashlib
+import multiprocessing
 import os
+import queue
 import shlex
+import shutil
 import subprocess
+import tempfile
+import threading
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+)
 from pathlib import Path
 from timeit import default_timer as timer
 from typing import List, Tuple
 
 import platform
 
-import asm_db
-import check_gtirb
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# gtirb, check_gtirb and asm_db are imported lazily at their use sites:
+# gtirb's protobuf descriptor registration alone costs a noticeable
+# fraction of interpreter startup, which is paid once per worker when
+# the matrix spawns one Python process per cell.
+
+# platform.system() performs a uname syscall on every call; the helpers
+# below are invoked for every make/strip/link of every matrix cell, so
+# look it up once.
+_SYSTEM = platform.system()
+
+# Copying os.environ decodes every variable again; snapshot it once and
+# overlay the per-cell settings on the snapshot. Nothing in the test
+# harness mutates the process environment after import.
+_BASE_ENV = dict(os.environ)
+
+# With VERBOSE unset, the progress output of the invoked tools is sent
+# to /dev/null; writing it through the parent's captured stdout can
+# bottleneck CI on fast machines.
+VERBOSE = False
+
+
+def _tool_stdout():
+    return None if VERBOSE else subprocess.DEVNULL
 
 
 class bcolors:
@@ -42,42 +79,115 @@ class bcolors:
         return cls.FAIL + " ".join(args) + cls.ENDC
 
 
+# FICLONE = _IOW(0x94, 9, int): share the source file's extents with the
+# destination, copy-on-write, instead of duplicating the bytes.
+_FICLONE = 0x40049409
+
+
+def _reflink_or_copy(src, dst):
+    """
+    Copy 'src' to 'dst', cloning extents (an O(1) metadata operation)
+    where the filesystem supports it rather than copying the data.
+    """
+    if fcntl is not None:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            try:
+                fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+                cloned = True
+            except OSError:
+                cloned = False
+        if cloned:
+            shutil.copymode(src, dst)
+            return
+    shutil.copy(src, dst)
+
+
+def _spawn(cmd):
+    """
+    Start 'cmd' and return a handle for _wait_exitcode.
+
+    Uses os.posix_spawn where available: unlike fork(), it does not copy
+    this process's page tables, which is significant once gtirb and its
+    protobuf machinery are loaded.
+    """
+    if hasattr(os, "posix_spawn"):
+        executable = shutil.which(cmd[0]) or cmd[0]
+        return os.posix_spawn(executable, cmd, os.environ)
+    return subprocess.Popen(cmd)
+
+
+def _wait_exitcode(handle):
+    """Wait on a handle returned by _spawn and return its exit code."""
+    if isinstance(handle, int):
+        _, status = os.waitpid(handle, 0)
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+    return handle.wait()
+
+
 @contextlib.contextmanager
-def get_target(binary, strip_exe, strip, sstrip, extra_strip_flags=None):
+def get_target(
+    binary, strip_exe, strip, sstrip, extra_strip_flags=None, cwd=None
+):
+    def in_dir(path):
+        return os.path.join(cwd, path) if cwd else path
+
+    def cmd_path(path):
+        # Under a chroot the wrapper maps 'cwd', so commands get paths
+        # relative to it; otherwise they get host paths they can resolve
+        # from any working directory.
+        return path if MAKE_CHROOT else in_dir(path)
+
+    stripped_binary = None
+    sstripped_binary = None
+    strip_procs = []
     if strip:
         print("# stripping binary\n")
-        subprocess.run(["cp", binary, binary + ".stripped"])
-        binary = binary + ".stripped"
+        stripped_binary = binary + ".stripped"
+        _reflink_or_copy(in_dir(binary), in_dir(stripped_binary))
 
-        cmd = build_chroot_wrapper() + [strip_exe, "--strip-unneeded", binary]
+        cmd = build_chroot_wrapper(cwd) + [
+            strip_exe,
+            "--strip-unneeded",
+            cmd_path(stripped_binary),
+        ]
         if extra_strip_flags:
             cmd.extend(extra_strip_flags)
 
-        completed_process = subprocess.run(cmd)
-        if completed_process.returncode != 0:
-            print(bcolors.fail("# strip failed\n"))
-            binary = None
-
-        stripped_binary = binary
+        strip_procs.append(("strip", _spawn(cmd)))
     if sstrip:
+        # sstrip discards everything outside the program headers, a
+        # superset of what strip removes, so it can run on its own copy
+        # of the original binary concurrently with strip.
         print("# stripping sections\n")
-        subprocess.run(["cp", binary, binary + ".sstripped"])
-        binary = binary + ".sstripped"
-        completed_process = subprocess.run(
-            build_chroot_wrapper() + ["sstrip", binary]
+        sstripped_binary = binary + ".sstripped"
+        _reflink_or_copy(in_dir(binary), in_dir(sstripped_binary))
+        strip_procs.append(
+            (
+                "sstrip",
+                _spawn(
+                    build_chroot_wrapper(cwd)
+                    + ["sstrip", cmd_path(sstripped_binary)]
+                ),
+            )
         )
-        if completed_process.returncode != 0:
-            print(bcolors.fail("# sstrip failed\n"))
+    for name, proc in strip_procs:
+        if _wait_exitcode(proc) != 0:
+            print(bcolors.fail("# {} failed\n".format(name)))
             binary = None
-
-        sstripped_binary = binary
+    if binary is not None:
+        if sstrip:
+            binary = sstripped_binary
+        elif strip:
+            binary = stripped_binary
     try:
         yield binary
     finally:
         if strip:
-            os.remove(stripped_binary)
+            Path(in_dir(stripped_binary)).unlink(missing_ok=True)
         if sstrip:
-            os.remove(sstripped_binary)
+            Path(in_dir(sstripped_binary)).unlink(missing_ok=True)
 
 
 @contextlib.contextmanager
@@ -110,39 +220,135 @@ MAKE_CHROOT = os.getenv("E2E_MAKE_CHROOT", None)
 MAKE_CHROOT_ROOT = resolve_chroot_root(MAKE_CHROOT)
 
 
-def build_chroot_wrapper() -> List[str]:
-    """Build command for executing in the configured chroot"""
+@functools.lru_cache(maxsize=None)
+def _chroot_wrapper(cwd) -> Tuple[str, ...]:
+    """Build the schroot prefix for commands running in 'cwd'"""
+    chroot_cwd_path = os.path.relpath(cwd, MAKE_CHROOT_ROOT)
+    return (
+        "schroot",
+        "--chroot",
+        MAKE_CHROOT,
+        "--directory",
+        chroot_cwd_path,
+        "--preserve-environment",
+        "--",
+    )
+
+
+def build_chroot_wrapper(cwd=None) -> List[str]:
+    """
+    Build command for executing in the configured chroot
+
+    'cwd' is the directory the wrapped command runs in; it defaults to
+    the current working directory.
+    """
     if MAKE_CHROOT:
-        chroot_cwd_path = os.path.relpath(os.getcwd(), MAKE_CHROOT_ROOT)
-        wrapper = [
-            "schroot",
-            "--chroot",
-            MAKE_CHROOT,
-            "--directory",
-            chroot_cwd_path,
-            "--preserve-environment",
-            "--",
-        ]
-    else:
-        wrapper = []
-    return wrapper
+        cwd = os.path.abspath(cwd) if cwd else os.getcwd()
+        return [*_chroot_wrapper(cwd)]
+    return []
 
 
-def make(target="") -> List[str]:
+def make(target="", cwd=None) -> List[str]:
     target = [] if target == "" else [target]
 
-    if platform.system() == "Linux":
-        return build_chroot_wrapper() + ["make", "-e"] + target
-    elif platform.system() == "Windows":
+    if _SYSTEM == "Linux":
+        return build_chroot_wrapper(cwd) + ["make", "-e"] + target
+    elif _SYSTEM == "Windows":
         return ["nmake", "/E", "/F", "Makefile.windows"] + target
     else:
-        raise Exception(f"Unsupported platform {platform.system()}")
+        raise Exception(f"Unsupported platform {_SYSTEM}")
 
 
-def quote_args(*args):
+@functools.lru_cache(maxsize=None)
+def _quote_args(args: Tuple[str, ...]) -> str:
     return " ".join(shlex.quote(arg) for arg in args)
 
 
+def quote_args(*args):
+    return _quote_args(args)
+
+
+# Optional cache of compiled binaries, keyed by the source tree and the
+# compiler environment. Reuses builds across runs on unchanged sources.
+COMPILE_CACHE = os.getenv("E2E_COMPILE_CACHE", None)
+
+# Harness outputs that not every example's 'make clean' removes; they
+# must not contribute to cache keys. Plain suffixes like ".s" are not
+# listed: the asm examples' sources end in ".s" and must be hashed, so
+# binary-derived names are excluded per project in _compile_cache_dir.
+CACHE_IGNORE_SUFFIXES = (".o", ".stripped", ".sstripped")
+
+
+def _tree_fingerprint(path, ignore_names=()):
+    """
+    Hash the path, size and mtime of every file under 'path', skipping
+    build artifacts.
+
+    Uses os.scandir directly: its DirEntry objects carry the stat
+    information gathered while listing the directory, so the traversal
+    needs no stat() syscall per file, and the metadata fingerprint
+    avoids reading every file's contents.
+    """
+    hasher = hashlib.blake2b()
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in sorted(entries, key=lambda entry: entry.path):
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                if entry.name in ignore_names or entry.name.endswith(
+                    CACHE_IGNORE_SUFFIXES
+                ):
+                    continue
+                stat_result = entry.stat()
+                hasher.update(os.path.relpath(entry.path, path).encode())
+                hasher.update(
+                    "{}:{}".format(
+                        stat_result.st_size, stat_result.st_mtime_ns
+                    ).encode()
+                )
+    return hasher
+
+
+def _tree_state(path):
+    """
+    Map each file under 'path' to its (size, mtime_ns), relative to
+    'path'. Comparing two states identifies what a build created or
+    rewrote.
+    """
+    state = {}
+    stack = [path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    continue
+                stat_result = entry.stat()
+                state[os.path.relpath(entry.path, path)] = (
+                    stat_result.st_size,
+                    stat_result.st_mtime_ns,
+                )
+    return state
+
+
+def _compile_cache_dir(env, binary, root="."):
+    """
+    Return the cache directory for compiling the project in 'root' with
+    the compiler settings in 'env'.
+    """
+    base = os.path.basename(binary)
+    hasher = _tree_fingerprint(
+        root,
+        ignore_names=(base, base + ".s", base + ".gtirb"),
+    )
+    for var in ("CC", "CXX", "CFLAGS", "CXXFLAGS", "EXEC", "TARGET_ARCH"):
+        if var in env:
+            hasher.update("{}={}".format(var, env[var]).encode())
+    return os.path.join(COMPILE_CACHE, hasher.hexdigest())
+
+
 def compile(
     compiler,
     cxx_compiler,
@@ -150,30 +356,188 @@ def compile(
     extra_flags,
     exec_wrapper=None,
     arch=None,
+    binary=None,
+    cwd=None,
 ):
     """
     Clean the project and compile it using the compiler
     'compiler', the cxx compiler 'cxx_compiler' and the flags in
     'optimizations' and 'extra_flags'
+
+    If a compile cache is configured and 'binary' is given, reuse a
+    previously built binary when the sources and compiler settings are
+    unchanged.
+
+    'cwd' selects the project directory; it defaults to the current
+    working directory.
     """
-    # Copy the current environment and modify the copy.
-    env = dict(os.environ)
-    env["CC"] = compiler
-    env["CXX"] = cxx_compiler
-    env["CFLAGS"] = quote_args(optimizations, *extra_flags)
-    env["CXXFLAGS"] = quote_args(optimizations, *extra_flags)
+    # Overlay the compiler settings on a copy of the base environment.
+    flags_str = quote_args(optimizations, *extra_flags)
+    env = dict(
+        _BASE_ENV,
+        CC=compiler,
+        CXX=cxx_compiler,
+        CFLAGS=flags_str,
+        CXXFLAGS=flags_str,
+    )
     if exec_wrapper:
         env["EXEC"] = exec_wrapper
     if arch:
         env["TARGET_ARCH"] = arch
+    root = cwd or "."
+    binary_path = os.path.join(root, binary) if binary else binary
     completedProcess = subprocess.run(
-        make("clean"), env=env, stdout=subprocess.DEVNULL
+        make("clean", cwd=cwd), env=env, stdout=subprocess.DEVNULL, cwd=cwd
     )
-    if completedProcess.returncode == 0:
-        completedProcess = subprocess.run(
-            make(), env=env, stdout=subprocess.DEVNULL
-        )
-    return completedProcess.returncode == 0
+    if completedProcess.returncode != 0:
+        return False
+    # The cache key is computed after 'make clean' so that build
+    # by-products of an earlier run cannot perturb the source-tree
+    # fingerprint; whatever clean leaves behind is a source.
+    cache_dir = None
+    pre_build = None
+    if COMPILE_CACHE and binary:
+        cache_dir = _compile_cache_dir(env, binary, root=root)
+        cached_binary = os.path.join(cache_dir, os.path.basename(binary))
+        if os.path.isfile(cached_binary):
+            # Restore everything the cached build produced, not just the
+            # binary: 'make all' also writes by-products such as the
+            # reference output that 'make check' diffs against.
+            print("# compile cache hit\n")
+            for dirpath, _, filenames in os.walk(cache_dir):
+                for filename in filenames:
+                    src = os.path.join(dirpath, filename)
+                    dst = os.path.join(
+                        root, os.path.relpath(src, cache_dir)
+                    )
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    shutil.copy(src, dst)
+            return True
+        pre_build = _tree_state(root)
+    completedProcess = subprocess.run(
+        make(cwd=cwd), env=env, stdout=subprocess.DEVNULL, cwd=cwd
+    )
+    if completedProcess.returncode != 0:
+        return False
+    if cache_dir and os.path.isfile(binary_path):
+        # Cache every file the build created or rewrote.
+        for relpath, stat_result in _tree_state(root).items():
+            if pre_build.get(relpath) == stat_result:
+                continue
+            dst = os.path.join(cache_dir, relpath)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy(os.path.join(root, relpath), dst)
+    return True
+
+
+# Optional cache of ddisasm outputs, keyed by the input binary contents,
+# the output format and the extra arguments. Reuses disassemblies across
+# runs on identical binaries.
+DDISASM_CACHE = os.getenv("E2E_DDISASM_CACHE", None)
+
+_ddisasm_version = None
+
+# Assembly uploads go through a small background pool so network latency
+# overlaps the rest of the pipeline. Created on first use: pools do not
+# survive the fork into process-pool workers.
+_upload_pool = None
+
+
+def _get_upload_pool():
+    global _upload_pool
+    if _upload_pool is None:
+        _upload_pool = ThreadPoolExecutor(max_workers=4)
+    return _upload_pool
+
+
+def _link_or_copy(src, dst):
+    """Hardlink 'src' to 'dst', falling back to a copy."""
+    Path(dst).unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy(src, dst)
+
+
+def _ddisasm_outputs(output, format, extra_args):
+    """
+    Map each output format requested from ddisasm to its output file.
+    """
+    outputs = {format: output}
+    for flag in ("--asm", "--ir"):
+        if flag in extra_args:
+            outputs[flag] = extra_args[extra_args.index(flag) + 1]
+    return outputs
+
+
+def _cached_ddisasm(
+    target_binary, output, format, extra_args, ddisasm_jobs, cwd=None
+):
+    """
+    Run ddisasm on 'target_binary', reusing cached outputs when the same
+    binary was already disassembled with the same arguments.
+
+    Returns (success, time_spent); cache hits report a time of 0.0.
+    """
+
+    def in_dir(path):
+        return os.path.join(cwd, path) if cwd else path
+
+    global _ddisasm_version
+    cache_dir = None
+    if DDISASM_CACHE:
+        if _ddisasm_version is None:
+            _ddisasm_version = subprocess.run(
+                ["ddisasm", "--version"],
+                capture_output=True,
+                encoding="utf-8",
+            ).stdout.strip()
+        hasher = hashlib.blake2b()
+        with open(in_dir(target_binary), "rb") as f:
+            hasher.update(f.read())
+        hasher.update(repr(sorted(extra_args)).encode())
+        hasher.update(format.encode())
+        hasher.update(_ddisasm_version.encode())
+        cache_dir = os.path.join(DDISASM_CACHE, hasher.hexdigest())
+        outputs = _ddisasm_outputs(output, format, extra_args)
+        if all(
+            os.path.isfile(os.path.join(cache_dir, os.path.basename(path)))
+            for path in outputs.values()
+        ):
+            print("# ddisasm cache hit\n")
+            for path in outputs.values():
+                _link_or_copy(
+                    os.path.join(cache_dir, os.path.basename(path)),
+                    in_dir(path),
+                )
+            return True, 0.0
+        # A leftover output may be a hardlink into the cache from an
+        # earlier hit; unlink before ddisasm rewrites it in place, or
+        # the write would reach through to the cached copy.
+        for path in outputs.values():
+            Path(in_dir(path)).unlink(missing_ok=True)
+    start = timer()
+    completedProcess = subprocess.run(
+        ["ddisasm", target_binary, format, output, "-j", str(ddisasm_jobs)]
+        + extra_args,
+        timeout=300,
+        env=dict(_BASE_ENV, OMP_NUM_THREADS=str(ddisasm_jobs)),
+        stdout=_tool_stdout(),
+        cwd=cwd,
+    )
+    time_spent = timer() - start
+    if completedProcess.returncode == 0 and cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        for path in _ddisasm_outputs(output, format, extra_args).values():
+            if os.path.isfile(in_dir(path)):
+                # Copy rather than hardlink: later cells rewrite the
+                # working-directory outputs in place, which would reach
+                # through a shared inode and poison the cache entry.
+                shutil.copy(
+                    in_dir(path),
+                    os.path.join(cache_dir, os.path.basename(path)),
+                )
+    return completedProcess.returncode == 0, time_spent
 
 
 def disassemble(
@@ -185,27 +549,38 @@ def disassemble(
     format="--asm",
     extra_args=[],
     extra_strip_flags=None,
+    ddisasm_jobs=None,
+    cwd=None,
 ):
     """
     Disassemble the binary 'binary' and generate ddisasm output 'output'
+
+    'ddisasm_jobs' bounds ddisasm's internal parallelism; it defaults to
+    the number of available cores. 'cwd' selects the directory 'binary'
+    and 'output' are resolved in; it defaults to the current working
+    directory.
     """
     if output is None:
         if format == "--asm":
             output = binary + ".s"
         elif format == "--ir":
             output = binary + ".gtirb"
+    if ddisasm_jobs is None:
+        ddisasm_jobs = os.cpu_count()
 
     with get_target(
-        binary, strip_exe, strip, sstrip, extra_strip_flags=extra_strip_flags
+        binary,
+        strip_exe,
+        strip,
+        sstrip,
+        extra_strip_flags=extra_strip_flags,
+        cwd=cwd,
     ) as target_binary:
         print("# Disassembling " + target_binary + "\n")
-        start = timer()
-        completedProcess = subprocess.run(
-            ["ddisasm", target_binary, format, output, "-j", "1"] + extra_args,
-            timeout=300,
+        success, time_spent = _cached_ddisasm(
+            target_binary, output, format, extra_args, ddisasm_jobs, cwd=cwd
         )
-        time_spent = timer() - start
-    if completedProcess.returncode == 0:
+    if success:
         print(bcolors.okgreen("Disassembly succeed"))
         return True, time_spent
     else:
@@ -213,17 +588,23 @@ def disassemble(
         return False, time_spent
 
 
-def run_reassembler(binary, reassemble_cmd_env) -> bool:
+def run_reassembler(
+    binary, reassemble_cmd_env, asm_path=None, cwd=None
+) -> bool:
     if not reassemble_cmd_env:
         print(bcolors.warning(" No reassemble"))
         return True
 
     reassemble_cmd, env = reassemble_cmd_env
+    if asm_path is None:
+        asm_path = binary + ".s"
 
-    print("# Reassembling", binary + ".s", "into", binary)
+    print("# Reassembling", asm_path, "into", binary)
     print("compile command:", reassemble_cmd)
 
-    proc = subprocess.run(reassemble_cmd, env=env)
+    proc = subprocess.run(
+        reassemble_cmd, env=env, stdout=_tool_stdout(), cwd=cwd
+    )
 
     if proc.returncode != 0:
         print(bcolors.fail("# Reassembly failed\n"))
@@ -232,22 +613,26 @@ def run_reassembler(binary, reassemble_cmd_env) -> bool:
     return True
 
 
-def build_reassemble_cmd(assembler, binary, extra_flags) -> Tuple[List, dict]:
+def build_reassemble_cmd(
+    assembler, binary, extra_flags, asm_path=None, cwd=None
+) -> Tuple[List, dict]:
     """
     Build a reassembler command for reassembling the assembly file
-    binary+'.s' into a new binary
+    'asm_path' (binary+'.s' by default) into a new binary run from 'cwd'
     """
+    if asm_path is None:
+        asm_path = binary + ".s"
     if "uasm" in assembler:
         obj = Path(binary).with_suffix(".o")
-        cmd = [assembler, *extra_flags, "-Fo", obj, binary + ".s"]
-    elif platform.system() == "Linux":
+        cmd = [assembler, *extra_flags, "-Fo", obj, asm_path]
+    elif _SYSTEM == "Linux":
         cmd = (
-            build_chroot_wrapper()
-            + [assembler, binary + ".s", "-o", binary]
+            build_chroot_wrapper(cwd)
+            + [assembler, asm_path, "-o", binary]
             + extra_flags
         )
-    elif platform.system() == "Windows":
-        cmd = [assembler, binary + ".s"] + extra_flags
+    elif _SYSTEM == "Windows":
+        cmd = [assembler, asm_path] + extra_flags
 
         if "/link" not in cmd:
             cmd.append("/link")
@@ -260,26 +645,33 @@ def build_reassemble_cmd(assembler, binary, extra_flags) -> Tuple[List, dict]:
         if "/safeseh" in extra_flags:
             cmd.insert(1, "/safeseh")
 
-    return (cmd, dict(os.environ))
+    return (cmd, dict(_BASE_ENV))
 
 
 def build_reassemble_make_call(
     assembler,
     makefile_target,
     extra_assembler_flags,
+    cwd=None,
 ) -> Tuple[List, dict]:
     """
     Build a reassembler command using Makefile with makefile_target
     """
-    # Copy the current environment and modify the copy.
-    env = dict(os.environ)
-    env["AS"] = assembler
-    env["ASFLAGS"] = quote_args(*extra_assembler_flags)
-    return (make(makefile_target), env)
+    # Overlay the assembler settings on a copy of the base environment.
+    env = dict(
+        _BASE_ENV,
+        AS=assembler,
+        ASFLAGS=quote_args(*extra_assembler_flags),
+    )
+    return (make(makefile_target, cwd=cwd), env)
 
 
 def link(
-    linker: str, binary: str, obj: List[str], extra_flags: List[str]
+    linker: str,
+    binary: str,
+    obj: List[str],
+    extra_flags: List[str],
+    cwd=None,
 ) -> bool:
     """Link a reassembled object file into a new binary."""
 
@@ -289,10 +681,14 @@ def link(
 
     print("# Linking", ", ".join(obj), "into", binary)
     cmd = (
-        build_chroot_wrapper() + [linker] + obj + ["-o", binary] + extra_flags
+        build_chroot_wrapper(cwd)
+        + [linker]
+        + obj
+        + ["-o", binary]
+        + extra_flags
     )
     print("link command:", " ".join(cmd))
-    proc = subprocess.run(cmd)
+    proc = subprocess.run(cmd, stdout=_tool_stdout(), cwd=cwd)
     if proc.returncode != 0:
         print(bcolors.fail("# Linking failed\n"))
         return False
@@ -300,16 +696,21 @@ def link(
     return True
 
 
-def test(exec_wrapper=None):
+def test(exec_wrapper=None, cwd=None):
     """
     Test the project with  'make check'.
     """
     print("# testing\n")
-    env = dict(os.environ)
+    env = dict(_BASE_ENV)
     if exec_wrapper:
         env["EXEC"] = exec_wrapper
     completedProcess = subprocess.run(
-        make("check"), env=env, stderr=subprocess.DEVNULL, timeout=60
+        make("check", cwd=cwd),
+        env=env,
+        stdout=_tool_stdout(),
+        stderr=subprocess.DEVNULL,
+        timeout=60,
+        cwd=cwd,
     )
     if completedProcess.returncode != 0:
         print(bcolors.fail("# Testing FAILED\n"))
@@ -319,6 +720,296 @@ def test(exec_wrapper=None):
         return True
 
 
+def _compile_one(
+    make_dir,
+    project_name,
+    binary,
+    compiler,
+    cxx_compiler,
+    optimization,
+    extra_compile_flags,
+    exec_wrapper,
+    arch,
+) -> bool:
+    """
+    Compile one (compiler, optimization) cell of the matrix in 'make_dir'.
+
+    Does not change the process working directory, so it can run in a
+    worker thread while another cell is being checked.
+    """
+    print(
+        bcolors.okblue(
+            "Project",
+            project_name,
+            "with",
+            compiler,
+            "and",
+            optimization,
+            *extra_compile_flags,
+        )
+    )
+    return compile(
+        compiler,
+        cxx_compiler,
+        optimization,
+        extra_compile_flags,
+        exec_wrapper,
+        arch,
+        binary=binary,
+        cwd=make_dir,
+    )
+
+
+def _check_one(
+    make_dir,
+    project_name,
+    binary,
+    compiler,
+    cxx_compiler,
+    optimization,
+    extra_compile_flags,
+    extra_reassemble_flags,
+    extra_link_flags,
+    reassembly_compiler,
+    makefile_target,
+    linker,
+    strip_exe,
+    strip,
+    sstrip,
+    skip_test,
+    skip_reassemble,
+    exec_wrapper,
+    arch,
+    extra_ddisasm_flags,
+    cfg_checks,
+    upload,
+    ddisasm_jobs,
+) -> Tuple[int, int, int, int, int]:
+    """
+    Disassemble, reassemble and test an already compiled
+    (compiler, optimization) cell of the matrix in 'make_dir'.
+
+    Returns the error counters (gtirb, disassembly, reassembly, link,
+    test) for the cell.
+    """
+    disassembly_errors = 0
+    reassembly_errors = 0
+    link_errors = 0
+    test_errors = 0
+    gtirb_errors = 0
+    upload_futures = []
+    # The derived paths are used several times per cell; build them once.
+    # The helpers receive make_dir as an explicit cwd instead of running
+    # under cd(): mutating the process-global working directory is not
+    # compatible with the thread-based execution modes.
+    asm_path = binary + ".s"
+    gtirb_filename = binary + ".gtirb"
+    obj_name = Path(binary).with_suffix(".o").name
+    reassemble_cmd_env = ([], {})
+    if not skip_reassemble:
+        if makefile_target:
+            reassemble_cmd_env = build_reassemble_make_call(
+                reassembly_compiler,
+                makefile_target,
+                extra_reassemble_flags,
+                cwd=make_dir,
+            )
+        else:
+            reassemble_cmd_env = build_reassemble_cmd(
+                reassembly_compiler,
+                binary,
+                extra_reassemble_flags,
+                asm_path=asm_path,
+                cwd=make_dir,
+            )
+    while True:
+        success, time = disassemble(
+            binary,
+            None,
+            strip_exe,
+            strip,
+            sstrip,
+            extra_args=["--ir", gtirb_filename] + extra_ddisasm_flags,
+            ddisasm_jobs=ddisasm_jobs,
+            cwd=make_dir,
+        )
+
+        # Do some GTIRB checks. Only deserialize the IR when there
+        # are checks to run; the protobuf parse is expensive for
+        # large binaries.
+        if success and cfg_checks:
+            import gtirb
+            import check_gtirb
+
+            module = gtirb.IR.load_protobuf(
+                os.path.join(make_dir, gtirb_filename)
+            ).modules[0]
+            gtirb_errors += check_gtirb.run_checks(module, cfg_checks)
+
+        print("Time " + str(time))
+        if not success:
+            disassembly_errors += 1
+            break
+
+        if not skip_reassemble:
+            if reassemble_cmd_env:
+                reasm_cmd, reasm_env = reassemble_cmd_env
+                flags_str = quote_args(optimization, *extra_compile_flags)
+                reasm_env["CC"] = compiler
+                reasm_env["CXX"] = cxx_compiler
+                reasm_env["CFLAGS"] = flags_str
+                reasm_env["CXXFLAGS"] = flags_str
+                if exec_wrapper:
+                    reasm_env["EXEC"] = exec_wrapper
+                if arch:
+                    reasm_env["TARGET_ARCH"] = arch
+                reassemble_cmd_env = (reasm_cmd, reasm_env)
+        if not run_reassembler(
+            binary, reassemble_cmd_env, asm_path=asm_path, cwd=make_dir
+        ):
+            reassembly_errors += 1
+            break
+        if linker and not link(
+            linker,
+            binary,
+            [obj_name],
+            extra_link_flags,
+            cwd=make_dir,
+        ):
+            link_errors += 1
+            break
+        if skip_test or skip_reassemble:
+            print(bcolors.warning(" No testing"))
+            break
+        if not test(exec_wrapper, cwd=make_dir):
+            test_errors += 1
+        break
+    if upload and not disassembly_errors:
+        import asm_db
+
+        # Submitted only once the cell's outcome is known, so the row
+        # records whether every stage passed: the pre-filter in
+        # disassemble_reassemble_test must not skip cells that are
+        # still failing, or were only partially run, on a rerun.
+        # The worker thread must not depend on the process-global
+        # working directory, so hand it an absolute path.
+        cell_passed = (
+            not skip_test
+            and not skip_reassemble
+            and gtirb_errors
+            + reassembly_errors
+            + link_errors
+            + test_errors
+            == 0
+        )
+        upload_futures.append(
+            _get_upload_pool().submit(
+                asm_db.upload,
+                project_name,
+                os.path.abspath(os.path.join(make_dir, asm_path)),
+                [compiler, cxx_compiler],
+                [optimization] + extra_compile_flags,
+                strip,
+                success=cell_passed,
+            )
+        )
+    # Surface upload errors before the cell's artifacts can be
+    # overwritten by the next one.
+    for future in upload_futures:
+        future.result()
+    return (
+        gtirb_errors,
+        disassembly_errors,
+        reassembly_errors,
+        link_errors,
+        test_errors,
+    )
+
+
+def _pin_worker(core_queue):
+    """
+    Process-pool initializer: pin this worker to its own disjoint set of
+    cores and size the OpenMP thread count to match, so the concurrent
+    cells' ddisasm threads do not oversubscribe the machine.
+    """
+    my_cores = core_queue.get()
+    os.sched_setaffinity(0, my_cores)
+    os.environ["OMP_NUM_THREADS"] = str(len(my_cores))
+    # Subprocess environments are built from the import-time snapshot.
+    _BASE_ENV["OMP_NUM_THREADS"] = str(len(my_cores))
+
+
+def _run_one(
+    make_dir,
+    project_name,
+    binary,
+    compiler,
+    cxx_compiler,
+    optimization,
+    extra_compile_flags,
+    extra_reassemble_flags,
+    extra_link_flags,
+    reassembly_compiler,
+    makefile_target,
+    linker,
+    strip_exe,
+    strip,
+    sstrip,
+    skip_test,
+    skip_reassemble,
+    exec_wrapper,
+    arch,
+    extra_ddisasm_flags,
+    cfg_checks,
+    upload,
+    ddisasm_jobs,
+) -> Tuple[int, int, int, int, int, int]:
+    """
+    Compile, disassemble, reassemble and test a single
+    (compiler, optimization) cell of the matrix in 'make_dir'.
+
+    Returns the error counters (compile, gtirb, disassembly, reassembly,
+    link, test) for the cell.
+    """
+    if not _compile_one(
+        make_dir,
+        project_name,
+        binary,
+        compiler,
+        cxx_compiler,
+        optimization,
+        extra_compile_flags,
+        exec_wrapper,
+        arch,
+    ):
+        return (1, 0, 0, 0, 0, 0)
+    return (0,) + _check_one(
+        make_dir,
+        project_name,
+        binary,
+        compiler,
+        cxx_compiler,
+        optimization,
+        extra_compile_flags,
+        extra_reassemble_flags,
+        extra_link_flags,
+        reassembly_compiler,
+        makefile_target,
+        linker,
+        strip_exe,
+        strip,
+        sstrip,
+        skip_test,
+        skip_reassemble,
+        exec_wrapper,
+        arch,
+        extra_ddisasm_flags,
+        cfg_checks,
+        upload,
+        ddisasm_jobs,
+    )
+
+
 def disassemble_reassemble_test(
     make_dir,
     binary,
@@ -341,126 +1032,253 @@ def disassemble_reassemble_test(
     extra_ddisasm_flags=[],
     cfg_checks=None,
     upload=True,
+    parallel=1,
+    pipeline=False,
+    ddisasm_jobs=None,
+    verbose=False,
 ):
     """
     Disassemble, reassemble and test an example with the given compilers and
     optimizations.
+
+    With 'parallel' > 1, the (compiler, optimization) cells of the matrix
+    run concurrently in a process pool, each in its own copy of 'make_dir'
+    (the cells mutate the project tree with 'make clean').
+
+    With 'pipeline', serial runs overlap the compilation of the next cell
+    with the disassembly, reassembly and testing of the current one.
     """
+    global VERBOSE
+    VERBOSE = verbose
     assert len(c_compilers) == len(cxx_compilers)
-    compile_errors = 0
-    disassembly_errors = 0
-    reassembly_errors = 0
-    link_errors = 0
-    test_errors = 0
-    gtirb_errors = 0
-    with cd(make_dir):
-        reassemble_cmd_env = ([], {})
-        if not skip_reassemble:
-            if makefile_target:
-                reassemble_cmd_env = build_reassemble_make_call(
-                    reassembly_compiler,
-                    makefile_target,
-                    extra_reassemble_flags,
-                )
-            else:
-                reassemble_cmd_env = build_reassemble_cmd(
-                    reassembly_compiler, binary, extra_reassemble_flags
-                )
-        for compiler, cxx_compiler in zip(c_compilers, cxx_compilers):
-            for optimization in optimizations:
-                print(
-                    bcolors.okblue(
-                        "Project",
-                        str(make_dir),
-                        "with",
-                        compiler,
-                        "and",
-                        optimization,
-                        *extra_compile_flags,
-                    )
-                )
-                if not compile(
+    project_name = os.path.basename(make_dir)
+    jobs = [
+        (compiler, cxx_compiler, optimization)
+        for compiler, cxx_compiler in zip(c_compilers, cxx_compilers)
+        for optimization in optimizations
+    ]
+    if upload:
+        import asm_db
+
+        # Skip cells this commit already uploaded as fully passing on
+        # this distro and CI image, e.g. on nightly reruns over an
+        # unchanged tree; failing cells run again.
+        jobs = [
+            (compiler, cxx_compiler, optimization)
+            for compiler, cxx_compiler, optimization in jobs
+            if not asm_db.has(
+                project_name,
+                [compiler, cxx_compiler],
+                [optimization] + extra_compile_flags,
+                strip,
+            )
+        ]
+        if not jobs:
+            print("# all cells already uploaded, nothing to do\n")
+            return True
+    cell_kwargs = dict(
+        extra_compile_flags=extra_compile_flags,
+        extra_reassemble_flags=extra_reassemble_flags,
+        extra_link_flags=extra_link_flags,
+        reassembly_compiler=reassembly_compiler,
+        makefile_target=makefile_target,
+        linker=linker,
+        strip_exe=strip_exe,
+        strip=strip,
+        sstrip=sstrip,
+        skip_test=skip_test,
+        skip_reassemble=skip_reassemble,
+        exec_wrapper=exec_wrapper,
+        arch=arch,
+        extra_ddisasm_flags=extra_ddisasm_flags,
+        cfg_checks=cfg_checks,
+        upload=upload,
+        ddisasm_jobs=ddisasm_jobs,
+    )
+    error_counts = (0,) * 6
+    if parallel <= 1 and not (pipeline and len(jobs) > 1):
+        for compiler, cxx_compiler, optimization in jobs:
+            cell_counts = _run_one(
+                make_dir,
+                project_name,
+                binary,
+                compiler,
+                cxx_compiler,
+                optimization,
+                **cell_kwargs,
+            )
+            error_counts = tuple(
+                total + cell for total, cell in zip(error_counts, cell_counts)
+            )
+    elif parallel <= 1:
+        # Two-stage pipeline: a producer thread compiles the next cell in
+        # its own copy of the project while the main thread disassembles,
+        # reassembles and tests the previous one. Both stages are
+        # dominated by subprocesses, so a thread is enough.
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            handoff = queue.Queue(maxsize=1)
+            stop = threading.Event()
+
+            def produce():
+                for index, (
                     compiler,
                     cxx_compiler,
                     optimization,
-                    extra_compile_flags,
-                    exec_wrapper,
-                    arch,
-                ):
-                    compile_errors += 1
-                    continue
+                ) in enumerate(jobs):
+                    if stop.is_set():
+                        return
+                    try:
+                        job_dir = os.path.join(
+                            scratch_dir, "job{}".format(index)
+                        )
+                        shutil.copytree(make_dir, job_dir)
+                        compiled = _compile_one(
+                            job_dir,
+                            project_name,
+                            binary,
+                            compiler,
+                            cxx_compiler,
+                            optimization,
+                            extra_compile_flags,
+                            exec_wrapper,
+                            arch,
+                        )
+                    except Exception as error:
+                        # The consumer blocks on handoff.get(); hand it
+                        # the failure rather than dying silently.
+                        handoff.put(error)
+                        return
+                    handoff.put(
+                        (
+                            job_dir,
+                            compiler,
+                            cxx_compiler,
+                            optimization,
+                            compiled,
+                        )
+                    )
 
-                gtirb_filename = binary + ".gtirb"
-                success, time = disassemble(
-                    binary,
-                    None,
-                    strip_exe,
-                    strip,
-                    sstrip,
-                    extra_args=["--ir", gtirb_filename] + extra_ddisasm_flags,
+            producer = threading.Thread(target=produce)
+            producer.start()
+            try:
+                for _ in jobs:
+                    item = handoff.get()
+                    if isinstance(item, Exception):
+                        raise item
+                    (
+                        job_dir,
+                        compiler,
+                        cxx_compiler,
+                        optimization,
+                        compiled,
+                    ) = item
+                    if not compiled:
+                        cell_counts = (1, 0, 0, 0, 0, 0)
+                    else:
+                        cell_counts = (0,) + _check_one(
+                            job_dir,
+                            project_name,
+                            binary,
+                            compiler,
+                            cxx_compiler,
+                            optimization,
+                            **cell_kwargs,
+                        )
+                    error_counts = tuple(
+                        total + cell
+                        for total, cell in zip(error_counts, cell_counts)
+                    )
+            finally:
+                # A consumer-side exception must not strand the producer
+                # blocked in put() on the full queue: tell it to stop,
+                # drain its pending item, and join it before the scratch
+                # directory is cleaned up.
+                stop.set()
+                while producer.is_alive():
+                    try:
+                        handoff.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+                producer.join()
+    else:
+        if hasattr(os, "sched_getaffinity"):
+            # Under cgroup limits (CI runners) the affinity mask can be
+            # smaller than os.cpu_count(); bound the pool by the cores
+            # this process may actually run on so no worker is handed an
+            # empty slice.
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(os.cpu_count()))
+        max_workers = min(parallel, len(jobs), len(cores))
+        if cell_kwargs["ddisasm_jobs"] is None:
+            # Split the cores between the concurrent cells to avoid
+            # oversubscribing them with ddisasm's internal threads.
+            cell_kwargs["ddisasm_jobs"] = max(1, len(cores) // max_workers)
+        initializer = None
+        initargs = ()
+        if hasattr(os, "sched_setaffinity"):
+            # Hand each worker its own slice of the cores.
+            core_queue = multiprocessing.Queue()
+            for worker in range(max_workers):
+                core_queue.put(cores[worker::max_workers])
+            initializer = _pin_worker
+            initargs = (core_queue,)
+        with tempfile.TemporaryDirectory() as scratch_dir, ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=initializer,
+            initargs=initargs,
+        ) as executor:
+            futures = []
+            for index, (compiler, cxx_compiler, optimization) in enumerate(
+                jobs
+            ):
+                job_dir = os.path.join(scratch_dir, "job{}".format(index))
+                shutil.copytree(make_dir, job_dir)
+                futures.append(
+                    executor.submit(
+                        _run_one,
+                        job_dir,
+                        project_name,
+                        binary,
+                        compiler,
+                        cxx_compiler,
+                        optimization,
+                        **cell_kwargs,
+                    )
+                )
+            for future in as_completed(futures):
+                error_counts = tuple(
+                    total + cell
+                    for total, cell in zip(error_counts, future.result())
                 )
+    return sum(error_counts) == 0
 
-                # Do some GTIRB checks
-                if success:
-                    module = gtirb.IR.load_protobuf(gtirb_filename).modules[0]
-                    gtirb_errors += check_gtirb.run_checks(
-                        module, cfg_checks or []
-                    )
 
-                if upload:
-                    asm_db.upload(
-                        os.path.basename(make_dir),
-                        binary + ".s",
-                        [compiler, cxx_compiler],
-                        [optimization] + extra_compile_flags,
-                        strip,
-                    )
-                print("Time " + str(time))
-                if not success:
-                    disassembly_errors += 1
-                    continue
+def disassemble_reassemble_tests(projects, max_procs=None, **kwargs):
+    """
+    Run disassemble_reassemble_test for every (make_dir, binary) pair in
+    'projects' with shared keyword arguments, returning True when every
+    project passes.
 
-                if not skip_reassemble:
-                    if reassemble_cmd_env:
-                        reasm_cmd, reasm_env = reassemble_cmd_env
-                        reasm_env["CC"] = compiler
-                        reasm_env["CXX"] = cxx_compiler
-                        reasm_env["CFLAGS"] = quote_args(
-                            optimization, *extra_compile_flags
-                        )
-                        reasm_env["CXXFLAGS"] = quote_args(
-                            optimization, *extra_compile_flags
-                        )
-                        if exec_wrapper:
-                            reasm_env["EXEC"] = exec_wrapper
-                        if arch:
-                            reasm_env["TARGET_ARCH"] = arch
-                        reassemble_cmd_env = (reasm_cmd, reasm_env)
-                if not run_reassembler(binary, reassemble_cmd_env):
-                    reassembly_errors += 1
-                    continue
-                if linker and not link(
-                    linker,
-                    binary,
-                    [Path(binary).with_suffix(".o").name],
-                    extra_link_flags,
-                ):
-                    link_errors += 1
-                    continue
-                if skip_test or skip_reassemble:
-                    print(bcolors.warning(" No testing"))
-                    continue
-                if not test(exec_wrapper):
-                    test_errors += 1
-    total_errors = (
-        compile_errors
-        + gtirb_errors
-        + disassembly_errors
-        + reassembly_errors
-        + link_errors
-        + test_errors
-    )
-    return total_errors == 0
+    Projects run concurrently on a thread pool: each one's work is
+    dominated by subprocesses and nothing in the harness depends on the
+    process working directory, so threads are enough to overlap the
+    per-project ddisasm and toolchain startups.
+    """
+    if not projects:
+        return True
+    if max_procs is None:
+        max_procs = min(len(projects), os.cpu_count())
+    with ThreadPoolExecutor(max_workers=max_procs) as pool:
+        results = list(
+            pool.map(
+                lambda project: disassemble_reassemble_test(
+                    *project, **kwargs
+                ),
+                projects,
+            )
+        )
+    return all(results)
 
 
 if __name__ == "__main__":
@@ -493,6 +1311,28 @@ if __name__ == "__main__":
     parser.add_argument(
         "--skip_reassemble", help="skip reassemble", action="store_true"
     )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        help="number of (compiler, optimization) cells to run concurrently",
+    )
+    parser.add_argument(
+        "--ddisasm_jobs",
+        type=int,
+        help="number of jobs for each ddisasm invocation",
+    )
+    parser.add_argument(
+        "--verbose",
+        help="show the output of the invoked tools",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--pipeline",
+        help="overlap compilation of the next cell with checking of the"
+        " current one in serial runs",
+        action="store_true",
+    )
 
     args = parser.parse_args()
     disassemble_reassemble_test(